@@ -1,5 +1,32 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 
 class DjangoWebApiConfig(AppConfig):
     name = 'django_web_api'
     verbose_name = "Django Web Api"
+    default_auto_field = "django.db.models.BigAutoField"
+
+    def ready(self):
+        from .basemodel import BaseModel
+        from .models import record_tombstone
+        from .sync import synced_parent_fks, synced_m2m, remember_parents, touch_parents, touch_deleted_parents, touch_m2m_parents
+
+        # Connected per sender so untracked models keep Django's fast delete path
+        for model in apps.get_models():
+            label = model._meta.label_lower
+
+            if issubclass(model, BaseModel) and model.track_deletions:
+                post_delete.connect(record_tombstone, sender=model, dispatch_uid=f"tombstone:{label}")
+
+            parent_fks = synced_parent_fks(model)
+            m2m_relations = synced_m2m(model)
+
+            if parent_fks:
+                pre_save.connect(remember_parents, sender=model, dispatch_uid=f"sync:remember:{label}")
+                post_save.connect(touch_parents, sender=model, dispatch_uid=f"sync:touch:{label}")
+
+            if parent_fks or m2m_relations:
+                pre_delete.connect(touch_deleted_parents, sender=model, dispatch_uid=f"sync:delete:{label}")
+
+            for through, _, _, _ in m2m_relations:
+                m2m_changed.connect(touch_m2m_parents, sender=through, dispatch_uid=f"sync:m2m:{through._meta.label_lower}")
@@ -2,6 +2,7 @@ from uuid import uuid4
 from django.db.models.base import ModelBase
 from django.conf import settings
 from .exceptions import ApiException
+from .serializers import SerializationMemo
 import logging
 import inspect
 
@@ -13,12 +14,15 @@ class BaseHandler():
     sanitize = True # Sanitize the output or not
     cached = False # Cache the response in Django cache backend
     cache_timeout = settings.CACHE_DEFAULT_TIMEOUT # secs
+    atomic = True # Run execute inside a single transaction
+    background = False # Queue the execution and answer with a job id, request headers, META, GET, POST and COOKIES are empty in the job
 
     def __init__(self, name, request):
         self.name = name
         self.request = request
         self.user = request.user
         self.request.batch_id = uuid4()
+        self.serialization_memo = SerializationMemo()
 
     @property
     def logger(self):
@@ -34,10 +38,13 @@ class BaseHandler():
 
         return f"handler:{app}__{handler_name}" in self.request.session.get("permissions", [])
 
+    def is_atomic(self, args):
+        return self.atomic
+
     def execute(self, **kwargs):
         raise NotImplementedError()
 
-    def execute_typed(self, kwargs):
+    def load_typed_args(self, kwargs):
         signature = inspect.signature(self.execute)
         parameters = signature.parameters
 
@@ -53,4 +60,7 @@ class BaseHandler():
                     qs = qs.select_subclasses()
                 kwargs[key] = qs.get()
 
-        return self.execute(**kwargs)
+        return kwargs
+
+    def execute_typed(self, kwargs):
+        return self.execute(**self.load_typed_args(kwargs))
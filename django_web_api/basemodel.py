@@ -3,6 +3,7 @@ from django.db import models
 from django.db.models.fields.related import ManyToManyField, OneToOneField, OneToOneRel
 import uuid
 
+M2M_STRATEGIES = ("aggregate", "prefetch", "auto")
 
 class BaseModel(models.Model):
     _base_api_fields = (
@@ -14,6 +15,9 @@ class BaseModel(models.Model):
     exposed_fields = tuple()
     formatters = dict()
     api_annotations = dict()
+    track_deletions = False # Record deletions as tombstones for the sync action
+    m2m_strategy = "aggregate" # "aggregate" (ArrayAgg on the main query), "prefetch" (one query per field) or "auto"
+    m2m_strategies = dict() # Per field override of m2m_strategy
 
     uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
 
@@ -107,6 +111,15 @@ class BaseModel(models.Model):
                 else:
                     print("Unknown field", field_name, "in", cls)
 
+        for strategy in (cls.m2m_strategy, *cls.m2m_strategies.values()):
+            if not strategy in M2M_STRATEGIES:
+                raise Exception(f"Unknown m2m strategy '{strategy}' in class {cls}.")
+
+        m2m_fields_name = set(field.name for field in many_to_many_fields)
+        for field_name in cls.m2m_strategies:
+            if not field_name in m2m_fields_name:
+                raise Exception(f"m2m strategy set for '{field_name}' which is not an exposed m2m field of class {cls}.")
+
         cls._direct_fields       = direct_fields
         cls._relateds_fields     = relateds_fields
         cls._property_fields     = property_fields
@@ -1,14 +1,23 @@
+from datetime import timedelta
 from django.apps import apps
+from django.conf import settings
 from django.db import IntegrityError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from .exceptions import ApiException
 from .basehandler import BaseHandler
-from .serializers import serialize, serialize_relateds, sanitize_qs
+from .basemodel import BaseModel
+from .deletion import delete_queryset, DELETE_MODES
+from .models import Tombstone
+from .sync import is_synced, touch
+from .serializers import serialize, serialize_relateds, sanitize_qs, resolve_relateds_fields
 from django.db.models import QuerySet, BinaryField
 import importlib
 import base64
 
-ALLOWED_ACTIONS = ("create", "read", "update", "delete", "filter", "preview")
+ALLOWED_ACTIONS = ("create", "read", "update", "delete", "filter", "preview", "sync")
 VALID_OPERATORS = ("in", "eq", "lt", "lte", "gt", "gte", "isnull", "contains", "icontains",)
+SYNC_OVERLAP = getattr(settings, "API_SYNC_OVERLAP", 5) # secs, covers transactions committing after the watermark
 
 def format_creation_args(model, dictionary):
     args = dict()
@@ -46,7 +55,7 @@ class Handler(BaseHandler):
                 getattr(model, "_crud__pre_save")(**data)
 
         if hasattr(model, f"_crud__{action}"):
-            return serialize(getattr(model, f"_crud__{action}")(self.request, **data), self.request.user)
+            return serialize(getattr(model, f"_crud__{action}")(self.request, **data), self.request.user, memo=self.serialization_memo)
 
         crud_method_return = getattr(self, action)(model, **data)
 
@@ -60,10 +69,23 @@ class Handler(BaseHandler):
 
             crud_method_return = serialize({
                 "data": crud_method_return
-            }, self.user)
+            }, self.user, memo=self.serialization_memo)
 
         return crud_method_return
 
+    def is_atomic(self, args):
+        # Chunked deletes commit each chunk on its own instead of locking everything until the end
+        if args.get("action") == "delete" and args.get("data", dict()).get("mode") == "chunked":
+            try:
+                app, model_name = args["model"].split(".")
+                model = apps.get_model(app_label=app, model_name=model_name)
+            except (KeyError, ValueError, LookupError):
+                return self.atomic # execute reports the wrong model
+
+            if not hasattr(model, "_crud__delete"): # A custom delete does not use the delete engine
+                return False
+        return self.atomic
+
     def check_permissions(self, args):
         if not self.request.user.is_authenticated:
             raise ApiException("User not authenticated", 401)
@@ -73,8 +95,8 @@ class Handler(BaseHandler):
         if not action in ALLOWED_ACTIONS:
             raise Exception(f"{action} is not an allowed action.")
 
-        if action in ("filter", "preview"):
-            action = "read" # Same permissions for filter & read
+        if action in ("filter", "preview", "sync"):
+            action = "read" # Same permissions for filter, sync & read
 
         app, model = args["model"].split(".")
 
@@ -97,20 +119,21 @@ class Handler(BaseHandler):
 
         return models, to_create
 
-    def format_response(self, data, with_relateds=False, fields_filter=None):
+    def format_response(self, data, with_relateds=False, fields_filter=None, relateds_fields=None):
         rel_dict = None
 
         if with_relateds:
             rel_dict = dict()
+            relateds_fields = resolve_relateds_fields(relateds_fields)
 
-        data = serialize(data, self.user, rel_dict, fields_filter)
+        data = serialize(data, self.user, rel_dict, fields_filter, memo=self.serialization_memo)
 
         resp = {
             "data": data,
         }
 
         if with_relateds:
-            resp["relateds"] = serialize_relateds(rel_dict)
+            resp["relateds"] = serialize_relateds(rel_dict, relateds_fields, self.serialization_memo)
 
         return resp
 
@@ -200,24 +223,79 @@ class Handler(BaseHandler):
 
         return qs
 
-    def read(self, model, filters, limit=-1, start=0, relateds=False):
+    def read(self, model, filters, limit=-1, start=0, relateds=False, relateds_fields=None):
         return self.format_response(
             self.read_queryset(model, filters, limit, start, get=True),
             relateds,
+            relateds_fields=relateds_fields
         )
 
-    def filter(self, model, filters, limit=-1, start=0, relateds=False):
+    def filter(self, model, filters, limit=-1, start=0, relateds=False, relateds_fields=None):
         return self.format_response(
             self.read_queryset(model, filters, limit, start),
-            relateds
+            relateds,
+            relateds_fields=relateds_fields
         )
 
-    def preview(self, model, filters, fields, limit=-1, start=0, relateds=False):
+    def preview(self, model, filters, fields, limit=-1, start=0, relateds=False, relateds_fields=None):
         return self.format_response(
             self.read_queryset(model, filters, limit, start),
             relateds,
-            fields_filter=fields
+            fields_filter=fields,
+            relateds_fields=relateds_fields
+        )
+
+    def sync(self, model, filters, since=None, relateds=False, relateds_fields=None):
+        if not model.track_deletions:
+            raise ApiException(f"{model.__name__} does not track deletions and cannot be synced", 400)
+
+        watermark = timezone.now()
+        reset = True
+
+        if since is not None:
+            try:
+                since_date = parse_datetime(since) if type(since) is str else None
+            except ValueError:
+                since_date = None
+            if since_date is None:
+                raise ApiException(f"Invalid sync watermark : {since}", 400)
+            if settings.USE_TZ and timezone.is_naive(since_date):
+                since_date = timezone.make_aware(since_date)
+
+            # Tombstones older than the retention are gone, the client has to start over
+            reset = since_date < Tombstone.retention_limit()
+
+        if reset:
+            queryset = self.read_queryset(model, filters)
+        else:
+            since_date -= timedelta(seconds=SYNC_OVERLAP)
+            queryset = self.read_queryset(model, filters + [{
+                "field": "updated_at",
+                "operator": "gt",
+                "value": since_date,
+            }])
+
+        resp = self.format_response(
+            queryset.order_by("updated_at", "pk"),
+            relateds,
+            relateds_fields=relateds_fields
         )
+        resp["watermark"] = watermark
+        resp["reset"] = reset
+        resp["deleted"] = list() if reset else self.sync_deleted(model, queryset, since_date)
+
+        return resp
+
+    def sync_deleted(self, model, changed, since):
+        # Deleted rows and rows updated out of the filters since the watermark, both bounded by the change volume.
+        # The pks are not scoped to what the client has, it ignores the ones it does not know.
+        deleted = Tombstone.deleted_since(model, since)
+        deleted += model.objects.filter(updated_at__gt=since) \
+                                .exclude(pk__in=changed.values("pk")) \
+                                .order_by("updated_at", "pk") \
+                                .values_list("pk", flat=True)
+
+        return list(dict.fromkeys(deleted))
 
     def update(self, model, fields):
         update_args = dict()
@@ -258,19 +336,33 @@ class Handler(BaseHandler):
             foreign_instances, bulk_create = self.get_or_create_model(field.related_model, objs)
 
             previous_instances = getattr(instance, field.name).all()
+            previous_parents = set(getattr(foreign_instance, field.field.attname) for foreign_instance in foreign_instances)
+
+            update_fields = [foreign_name]
+            track_updates = issubclass(field.related_model, BaseModel)
+            if track_updates:
+                update_fields.append("updated_at") # bulk_update skips auto_now, sync relies on it
+            now = timezone.now()
 
             for prev_instance in previous_instances:
                 if prev_instance in foreign_instances:
                     continue
                 setattr(prev_instance, foreign_name, None) # Break relations that does not exists anymore
+                if track_updates:
+                    prev_instance.updated_at = now
 
             for foreign_instance in foreign_instances:
                 setattr(foreign_instance, foreign_name, instance) # Create new relations
+                if track_updates:
+                    foreign_instance.updated_at = now
 
             if bulk_create:
                 field.related_model.objects.bulk_create(bulk_create)
-            field.related_model.objects.bulk_update(foreign_instances, [foreign_name])
-            field.related_model.objects.bulk_update(previous_instances, [foreign_name])
+            field.related_model.objects.bulk_update(foreign_instances, update_fields)
+            field.related_model.objects.bulk_update(previous_instances, update_fields)
+
+            if is_synced(model, field.name): # bulk_update sends no signals
+                touch(model, previous_parents - {instance.pk})
 
         for field_name, instances in m2m_set.items():
             getattr(instance, field_name).set(instances)
@@ -279,10 +371,15 @@ class Handler(BaseHandler):
         instance.save()
         return instance
 
-    def delete(self, model, filters, limit=-1, start=0):
+    def delete(self, model, filters, limit=-1, start=0, mode="auto", dry_run=False):
+        if mode not in DELETE_MODES:
+            raise ApiException(f"{mode} is not a supported delete mode.", 400)
+
         queryset = self.read_queryset(model, filters, limit, start)
-        deleteds = queryset.delete()
+        deleteds = delete_queryset(queryset, mode, dry_run)
         return {
-            "length": deleteds[0]
+            "length": sum(deleteds.values()),
+            "deleteds": dict(deleteds),
+            "dry_run": dry_run,
         }
 
@@ -0,0 +1,113 @@
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models.deletion import Collector
+from .basemodel import BaseModel
+from .models import Tombstone, deferred_tombstones
+from .sync import deleted_parents, touch
+
+DELETE_CHUNK_SIZE = getattr(settings, "API_DELETE_CHUNK_SIZE", 1000)
+DELETE_MODES = ("auto", "chunked")
+
+def deletable_qs(qs):
+    # Django refuses to delete sliced or distinct querysets, resolve them to a plain pk filter
+    manager = qs.model._base_manager.using(qs.db)
+
+    if qs.query.is_sliced:
+        return manager.filter(pk__in=list(qs.values_list("pk", flat=True)))
+
+    if qs.query.distinct or qs.query.combinator:
+        return manager.filter(pk__in=qs.values("pk"))
+
+    return qs.order_by()
+
+def can_fast_delete(qs):
+    # No signal receivers, no cascades and no generic relations: a single DELETE is enough
+    return Collector(using=qs.db).can_fast_delete(qs)
+
+def pk_chunks(qs, chunk_size=DELETE_CHUNK_SIZE):
+    qs = qs.order_by("pk")
+    last_pk = None
+
+    while True:
+        chunk_qs = qs if last_pk is None else qs.filter(pk__gt=last_pk)
+        pks = list(chunk_qs.values_list("pk", flat=True)[:chunk_size])
+        if not pks:
+            return
+
+        yield pks
+        last_pk = pks[-1]
+
+def collect_chunk(model, pks, using):
+    collector = Collector(using=using)
+    collector.collect(model._base_manager.using(using).filter(pk__in=pks))
+    return collector
+
+def delete_chunk(model, pks, using):
+    collector = collect_chunk(model, pks, using)
+
+    # pks are read before the delete, the collector resets them on the instances
+    tombstones = {
+        collected_model: [instance.pk for instance in instances]
+        for collected_model, instances in collector.data.items()
+        if issubclass(collected_model, BaseModel) and collected_model.track_deletions
+    }
+
+    # Synced parents losing children or m2m links, read before the through rows are deleted
+    parents = defaultdict(set)
+    for collected_model, instances in collector.data.items():
+        for parent, parent_pks in deleted_parents(collected_model, instances, using).items():
+            parents[parent].update(parent_pks)
+    for parent, parent_pks in parents.items():
+        parent_pks.difference_update(instance.pk for instance in collector.data.get(parent, ())) # Deleted with the chunk
+
+    token = deferred_tombstones.set(True)
+    try:
+        with transaction.atomic(using=using):
+            _, counts = collector.delete()
+
+            for tracked_model, tracked_pks in tombstones.items():
+                Tombstone.record(tracked_model, tracked_pks, using)
+
+            for parent, parent_pks in parents.items():
+                touch(parent, parent_pks, using)
+    finally:
+        deferred_tombstones.reset(token)
+
+    return counts
+
+def count_cascade(qs, chunk_size=DELETE_CHUNK_SIZE):
+    model = qs.model
+    counts = Counter()
+
+    if can_fast_delete(qs):
+        counts[model._meta.label] = qs.count()
+        return counts
+
+    for pks in pk_chunks(qs, chunk_size):
+        collector = collect_chunk(model, pks, qs.db)
+
+        for collected_model, instances in collector.data.items():
+            counts[collected_model._meta.label] += len(instances)
+
+        for fast_qs in collector.fast_deletes:
+            counts[fast_qs.model._meta.label] += fast_qs.count()
+
+    return counts
+
+def delete_queryset(qs, mode="auto", dry_run=False, chunk_size=DELETE_CHUNK_SIZE):
+    # auto: a single DELETE when the model allows it, bounded pk ordered chunks otherwise
+    # chunked: always chunks, each one is committed on its own outside of an atomic block
+    qs = deletable_qs(qs)
+
+    if dry_run:
+        return count_cascade(qs, chunk_size)
+
+    if mode == "auto" and can_fast_delete(qs):
+        return Counter(qs.delete()[1]) # A single DELETE for a fast deletable queryset
+
+    counts = Counter()
+    for pks in pk_chunks(qs, chunk_size):
+        counts.update(delete_chunk(qs.model, pks, qs.db))
+
+    return counts
@@ -10,7 +10,8 @@ from django.db.models.query import ValuesIterable, QuerySet
 from django.utils import timezone
 
 from .exceptions import ApiException
-from .serializers import serialize, serialize_relateds
+from .jobs import enqueue_job
+from .serializers import SerializationContext, dumps, serialize_relateds
 from .basemodel import BaseModel
 
 import orjson
@@ -20,7 +21,10 @@ import base64
 import zlib
 
 def handle_request(request):
-    logger = logging.getLogger("api")
+    handler = None
+    handler_path = None
+    background = False
+
     try:
         try:
             request_obj = orjson.loads(request.body.decode('utf-8'))
@@ -56,37 +60,88 @@ def handle_request(request):
 
                 return response
 
-        with transaction.atomic():
-            handler_resp = handler.execute_typed(args)
+        background = handler.background or request_obj.get('background', False) is True
 
-        if isinstance(handler_resp, HttpResponseBase):
-            return handler_resp
-
-        if type(handler_resp) is not dict:
-            handler_resp = {
-                'data': handler_resp
+        if background:
+            # Acknowledgement only, the handler's serialization applies to the job result
+            data = {
+                'job': enqueue_job(handler, args),
+                'status': True,
+                'generated_on': timezone.now()
             }
+        else:
+            if handler.is_atomic(args):
+                with transaction.atomic():
+                    handler_resp = handler.execute_typed(args)
+            else:
+                handler_resp = handler.execute_typed(args)
 
-        # crud has its own serialization
-        if not handler.prevent_serialization:
-            rel_dict = None
-            if handler.relateds:
-                rel_dict = dict()
+            if isinstance(handler_resp, HttpResponseBase):
+                return handler_resp
 
-            handler_resp = serialize(handler_resp, request.user, rel_dict, [], handler.sanitize)
+            data = format_handler_response(handler, handler_resp)
+        status = 200
+
+    except Exception as e:
+        data, status = format_exception(e)
 
-            if handler.relateds:
-                handler_resp["relateds"] = serialize_relateds(rel_dict)
+    data, status = encode_response(data, status, handler)
 
-        data = {
-            'status': True,
-            'generated_on': timezone.now()
+    if handler is None or background:
+        return make_response(data, status)
+
+    return make_response(
+        data,
+        status,
+        handler.zlib_compress,
+        handler_path if handler.cached else None,
+        handler.cache_timeout
+    )
+
+
+def format_handler_response(handler, handler_resp):
+    if type(handler_resp) is not dict:
+        handler_resp = {
+            'data': handler_resp
         }
 
-        data = {**handler_resp, **data}
-        status = 200
+    data = {
+        'status': True,
+        'generated_on': timezone.now()
+    }
+
+    # crud has its own serialization
+    if handler.prevent_serialization:
+        return {**handler_resp, **data}
+
+    rel_dict = None
+    if handler.relateds:
+        rel_dict = dict()
+
+    context = SerializationContext(handler.user, rel_dict, [], handler.sanitize, handler.serialization_memo)
+
+    # The response is dumped first so relateds are collected before being serialized themselves,
+    # the remaining keys are then appended to the encoded object
+    appended = ('status', 'generated_on', 'relateds') if handler.relateds else ('status', 'generated_on')
+    encoded = dumps({key: value for key, value in handler_resp.items() if not key in appended}, context)
 
-    except ValidationError as e:
+    if handler.relateds:
+        data["relateds"] = serialize_relateds(rel_dict, None, handler.serialization_memo)
+
+    return merge_encoded_objects(encoded, dumps(data, context))
+
+
+def merge_encoded_objects(first, second):
+    # Both are orjson encoded dicts with distinct keys
+    if first == b"{}":
+        return second
+    return first[:-1] + b"," + second[1:]
+
+
+def format_exception(e):
+    logger = logging.getLogger("api")
+
+    if isinstance(e, ValidationError):
         logger.error(str(e), extra={'exception_obj': e})
         errors = list()
 
@@ -103,7 +158,7 @@ def handle_request(request):
             'status': False
         }
         status = 400
-    except ObjectDoesNotExist as e:
+    elif isinstance(e, ObjectDoesNotExist):
         logger.error(str(e), extra={'exception_obj': e})
         error_message = str(e)
         data = {
@@ -111,7 +166,7 @@ def handle_request(request):
             'status': False
         }
         status = 404
-    except ApiException as e:
+    elif isinstance(e, ApiException):
         logger.error(str(e), extra={'exception_obj': e})
         error_message = str(e)
         data = {
@@ -120,7 +175,7 @@ def handle_request(request):
         }
         status = e.status
         #capture_exception(e)
-    except Exception as e:
+    else:
         error_message = "Unexpected internal server error, please contact support."
 
         if settings.DEBUG:
@@ -134,8 +189,21 @@ def handle_request(request):
         logger.error(str(e), extra={'exception_obj': e})
         #capture_exception(e)
 
+    return data, status
+
+
+def encode_response(data, status, handler=None):
+    if type(data) is bytes: # Already encoded by format_handler_response
+        return data, status
+
+    # Handlers with prevent_serialization (crud) may still leave Decimals or registered types behind
+    if handler is None:
+        context = SerializationContext()
+    else:
+        context = SerializationContext(handler.user, None, [], handler.sanitize, handler.serialization_memo)
+
     try:
-        data = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        data = dumps(data, context)
     except Exception as e:
         error_message = "Unexpected internal server error while sending response, please contact support."
 
@@ -148,15 +216,19 @@ def handle_request(request):
         }
         data = orjson.dumps(data)
         status = 500
-        logger.error(str(e), extra={'exception_obj': e})
+        logging.getLogger("api").error(str(e), extra={'exception_obj': e})
+
+    return data, status
+
 
+def make_response(data, status, zlib_compress=False, cache_key=None, cache_timeout=None):
     response = HttpResponse(status=status, content_type="application/json")
-    if handler.zlib_compress:
+    if zlib_compress:
         data = zlib.compress(data)
         response["Content-Encoding"] = "deflate"
 
-    if handler.cached and status == 200 and not settings.DEBUG:
-        cache.set(handler_path, data, timeout=handler.cache_timeout)
+    if cache_key and status == 200 and not settings.DEBUG:
+        cache.set(cache_key, data, timeout=cache_timeout)
 
     response.write(data)
     return response
@@ -0,0 +1,29 @@
+from ..basehandler import BaseHandler
+from ..exceptions import ApiException, ObjectNotFoundApiException
+from ..handler import get_handler_class, make_response
+from ..models import Job
+
+
+class Handler(BaseHandler):
+    prevent_serialization = True
+
+    def check_permissions(self, args):
+        if not self.request.user.is_authenticated:
+            raise ApiException("User not authenticated", 401)
+
+        return True # Jobs are only visible to their owner, checked in execute
+
+    def execute(self, job: Job):
+        if job.user_id != self.user.pk:
+            raise ObjectNotFoundApiException(f"Job {job.pk} does not exist")
+
+        if job.is_stale():
+            Job.fail_stale()
+            job.refresh_from_db()
+
+        if job.status in (Job.PENDING, Job.RUNNING):
+            raise ApiException(f"Job {job.pk} is still {job.status}", 409, log_write=False)
+
+        # The result was serialized by the worker, only compression is left to the original handler's settings
+        handler_class, _ = get_handler_class(job.handler)
+        return make_response(bytes(job.result), job.result_status, handler_class.zlib_compress)
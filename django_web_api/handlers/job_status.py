@@ -0,0 +1,33 @@
+from ..basehandler import BaseHandler
+from ..exceptions import ApiException, ObjectNotFoundApiException
+from ..models import Job
+
+
+class Handler(BaseHandler):
+    prevent_serialization = True
+
+    def check_permissions(self, args):
+        if not self.request.user.is_authenticated:
+            raise ApiException("User not authenticated", 401)
+
+        return True # Jobs are only visible to their owner, checked in execute
+
+    def execute(self, job: Job):
+        if job.user_id != self.user.pk:
+            raise ObjectNotFoundApiException(f"Job {job.pk} does not exist")
+
+        if job.is_stale():
+            Job.fail_stale()
+            job.refresh_from_db()
+
+        return {
+            "job": {
+                "uuid": job.uuid,
+                "handler": job.handler,
+                "status": job.status,
+                "result_status": job.result_status,
+                "created_at": job.created_at,
+                "started_at": job.started_at,
+                "finished_at": job.finished_at,
+            }
+        }
@@ -0,0 +1,129 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import get_context
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections, transaction
+from django.http import QueryDict
+from django.http.response import HttpResponseBase
+from django.utils.module_loading import import_string
+from .models import Job
+import django
+
+BACKGROUND_EXECUTOR = getattr(settings, "API_BACKGROUND_EXECUTOR", "django_web_api.jobs.ThreadExecutor")
+BACKGROUND_WORKERS = getattr(settings, "API_BACKGROUND_WORKERS", 4)
+
+_executor = None
+
+
+class JobRequest():
+    # Stands for the HTTP request a background handler was queued from
+    method = "POST"
+
+    def __init__(self, job, session):
+        self.job = job
+        self.user = job.user or AnonymousUser()
+        self.session = session
+        # Nothing from the original request is kept, handlers reading it get empty values
+        self.headers = dict()
+        self.META = dict()
+        self.COOKIES = dict()
+        self.GET = QueryDict()
+        self.POST = QueryDict()
+        self.body = b""
+
+
+class BaseExecutor():
+    def submit(self, job_id):
+        raise NotImplementedError()
+
+
+class ThreadExecutor(BaseExecutor):
+    def __init__(self):
+        self.pool = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="api-job")
+
+    def submit(self, job_id):
+        self.pool.submit(run_job, job_id)
+
+
+class ProcessExecutor(BaseExecutor):
+    def __init__(self):
+        # spawn instead of fork, forked children would share the parent's database connections
+        self.pool = ProcessPoolExecutor(
+            max_workers=BACKGROUND_WORKERS,
+            mp_context=get_context("spawn"),
+            initializer=django.setup,
+        )
+
+    def submit(self, job_id):
+        self.pool.submit(run_job, job_id)
+
+
+class DatabaseExecutor(BaseExecutor):
+    # Jobs stay pending in the database until the run_api_jobs command picks them
+    def submit(self, job_id):
+        pass
+
+
+def get_executor_class():
+    return import_string(BACKGROUND_EXECUTOR)
+
+
+def get_executor():
+    global _executor
+
+    if _executor is None:
+        _executor = get_executor_class()()
+
+    return _executor
+
+
+def enqueue_job(handler, args):
+    handler.load_typed_args(dict(args)) # Fail now on bad arguments, the worker loads them again
+    job = Job.create_for(handler, args)
+    transaction.on_commit(lambda: get_executor().submit(job.pk))
+    return job.pk
+
+
+def run_job(job_id):
+    from .handler import get_handler_class, format_handler_response, format_exception, encode_response, make_response
+
+    try:
+        job = Job.objects.select_related("user").get(pk=job_id)
+        if not job.claim():
+            return
+
+        try:
+            payload = job.load_payload()
+            request = JobRequest(job, payload["session"])
+            handler_class, name = get_handler_class(job.handler)
+            handler = handler_class(name, request)
+
+            if handler.is_atomic(payload["args"]):
+                with transaction.atomic():
+                    handler_resp = handler.execute_typed(payload["args"])
+            else:
+                handler_resp = handler.execute_typed(payload["args"])
+
+            if isinstance(handler_resp, HttpResponseBase):
+                data, status = handler_resp.content, handler_resp.status_code
+            else:
+                data, status = encode_response(format_handler_response(handler, handler_resp), 200, handler)
+        except Exception as e:
+            handler = None
+            data, status = encode_response(*format_exception(e))
+
+        if handler is not None and handler.cached:
+            make_response(data, status, handler.zlib_compress, job.handler, handler.cache_timeout)
+
+        job.finish(data, status)
+    finally:
+        connections.close_all()
+
+
+def run_pending_jobs():
+    Job.fail_stale()
+    count = 0
+    for job_id in Job.objects.filter(status=Job.PENDING).order_by("created_at").values_list("pk", flat=True):
+        run_job(job_id)
+        count += 1
+    return count
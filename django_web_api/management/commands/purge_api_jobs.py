@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from django_web_api.models import Job
+
+
+class Command(BaseCommand):
+    help = "Delete background jobs older than API_JOB_RETENTION"
+
+    def handle(self, *args, **options):
+        count = Job.purge()
+        self.stdout.write(f"{count} jobs purged")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from django_web_api.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = "Delete sync tombstones older than API_TOMBSTONE_RETENTION"
+
+    def handle(self, *args, **options):
+        count = Tombstone.purge()
+        self.stdout.write(f"{count} tombstones purged")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django_web_api.jobs import run_pending_jobs
+import time
+
+
+class Command(BaseCommand):
+    help = "Run background handlers queued with the DatabaseExecutor"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Run pending jobs then exit")
+        parser.add_argument("--interval", type=float, default=1.0, help="Polling interval in secs")
+
+    def handle(self, *args, **options):
+        while True:
+            count = run_pending_jobs()
+            if count:
+                self.stdout.write(f"{count} jobs run")
+
+            if options["once"]:
+                break
+
+            time.sleep(options["interval"])
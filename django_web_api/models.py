@@ -0,0 +1,152 @@
+from contextvars import ContextVar
+from datetime import timedelta
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+import orjson
+import uuid
+
+TOMBSTONE_RETENTION = getattr(settings, "API_TOMBSTONE_RETENTION", 30 * 24 * 3600) # secs
+JOB_RETENTION = getattr(settings, "API_JOB_RETENTION", 24 * 3600) # secs
+JOB_TIMEOUT = getattr(settings, "API_JOB_TIMEOUT", 3600) # secs, a running job older than this is considered lost
+JOB_SESSION_KEYS = getattr(settings, "API_JOB_SESSION_KEYS", ("permissions",)) # Session keys handlers need in the worker
+
+deferred_tombstones = ContextVar("deferred_tombstones", default=False)
+
+
+class Tombstone(models.Model):
+    model = models.CharField(max_length=255)
+    object_pk = models.CharField(max_length=255)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["model", "deleted_at"], name="django_web_api_tombstone_idx"),
+        ]
+
+    @classmethod
+    def record(cls, model, pks, using=None):
+        label = model._meta.label_lower
+        now = timezone.now()
+        cls.objects.using(using).bulk_create([
+            cls(model=label, object_pk=str(pk), deleted_at=now) for pk in pks
+        ])
+
+    @classmethod
+    def deleted_since(cls, model, since):
+        pks = cls.objects.filter(model=model._meta.label_lower, deleted_at__gt=since) \
+                         .order_by("deleted_at") \
+                         .values_list("object_pk", flat=True)
+        return [model._meta.pk.to_python(pk) for pk in dict.fromkeys(pks)]
+
+    @classmethod
+    def retention_limit(cls):
+        return timezone.now() - timedelta(seconds=TOMBSTONE_RETENTION)
+
+    @classmethod
+    def purge(cls):
+        return cls.objects.filter(deleted_at__lt=cls.retention_limit()).delete()[0]
+
+
+def record_tombstone(sender, instance, using=None, **kwargs):
+    if deferred_tombstones.get():
+        return # The delete engine records them in bulk
+
+    Tombstone.record(sender, [instance.pk], using)
+
+
+class Job(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = (
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    handler = models.CharField(max_length=255)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.CASCADE, related_name="+")
+    status = models.CharField(max_length=16, choices=STATUSES, default=PENDING, db_index=True)
+    payload = models.BinaryField()
+    result = models.BinaryField(null=True)
+    result_status = models.PositiveSmallIntegerField(null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    @classmethod
+    def create_for(cls, handler, args):
+        # Only the raw JSON args and the needed session keys are kept, never headers or cookies
+        request = handler.request
+        user = request.user if request.user.is_authenticated else None
+        payload = {
+            "args": args,
+            "session": {key: request.session[key] for key in JOB_SESSION_KEYS if key in request.session},
+        }
+
+        return cls.objects.create(handler=handler.name, user=user, payload=orjson.dumps(payload))
+
+    def load_payload(self):
+        return orjson.loads(bytes(self.payload))
+
+    def claim(self):
+        # Only one worker can move a job out of pending
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=self.pk, status=Job.PENDING).update(status=Job.RUNNING, started_at=now)
+        if claimed:
+            self.status = Job.RUNNING
+            self.started_at = now
+        return bool(claimed)
+
+    def finish(self, result, status):
+        # A job failed as stale in the meantime keeps its timeout result
+        self.result = result
+        self.result_status = status
+        self.status = Job.DONE if status == 200 else Job.FAILED
+        self.finished_at = timezone.now()
+        Job.objects.filter(pk=self.pk, status=Job.RUNNING).update(
+            result=result,
+            result_status=status,
+            status=self.status,
+            finished_at=self.finished_at,
+        )
+
+    def is_stale(self):
+        limit = timezone.now() - timedelta(seconds=JOB_TIMEOUT)
+        if self.status == Job.RUNNING:
+            return self.started_at < limit
+        return self.status == Job.PENDING and self.created_at < limit and pending_jobs_can_be_lost()
+
+    @classmethod
+    def fail_stale(cls):
+        # Workers that died or were lost on restart leave their jobs running forever,
+        # in memory executors also lose the jobs still pending in their queue
+        now = timezone.now()
+        limit = now - timedelta(seconds=JOB_TIMEOUT)
+        stale = models.Q(status=cls.RUNNING, started_at__lt=limit)
+        if pending_jobs_can_be_lost():
+            stale |= models.Q(status=cls.PENDING, created_at__lt=limit)
+
+        return cls.objects.filter(stale).update(
+            status=cls.FAILED,
+            result=orjson.dumps({"errors": ["Job timed out"], "status": False}),
+            result_status=504,
+            finished_at=now,
+        )
+
+    @classmethod
+    def purge(cls):
+        cls.fail_stale()
+        limit = timezone.now() - timedelta(seconds=JOB_RETENTION)
+        return cls.objects.filter(created_at__lt=limit).exclude(status=cls.RUNNING).delete()[0]
+
+
+def pending_jobs_can_be_lost():
+    # Thread and process pools keep their queue in memory, the database executor's queue survives restarts
+    from .jobs import get_executor_class, DatabaseExecutor
+    return not issubclass(get_executor_class(), DatabaseExecutor)
@@ -1,57 +1,168 @@
 from collections import OrderedDict
+from decimal import Decimal
+from django.apps import apps
 from django.contrib.postgres.aggregates.general import ArrayAgg
 from django.db import NotSupportedError
-from django.db.models import Q, Model
+from django.conf import settings
+from django.db.models import Q, Model, ManyToManyField
 from django.db.models.query import ValuesIterable, QuerySet
+from .basemodel import BaseModel
+from .exceptions import ApiException
+import base64
+import orjson
 
-def serialize_polymorphic_qs(qs, rel_dict=None, filtered_fields=None):
+M2M_PREFETCH_THRESHOLD = getattr(settings, "API_M2M_PREFETCH_THRESHOLD", 2) # m2m fields, for the "auto" strategy
+
+class SerializationMemo():
+    # Request scoped identity map: rows already serialized, keyed by (model, pk, fields)
+    def __init__(self):
+        self.rows = dict()
+        self.visibles = dict() # model -> pks that already went through sanitize_qs
+
+    def key(self, model, pk, filtered_fields):
+        return (model, pk, frozenset(filtered_fields) if filtered_fields else None)
+
+    def get(self, model, pk, filtered_fields):
+        return self.rows.get(self.key(model, pk, filtered_fields))
+
+    def add(self, model, rows, filtered_fields):
+        for obj in rows:
+            if "pk" in obj:
+                self.rows[self.key(model, obj["pk"], filtered_fields)] = obj
+
+    def is_visible(self, model, pk):
+        return pk in self.visibles.get(model, ())
+
+    def add_visibles(self, model, rows):
+        visibles = self.visibles.setdefault(model, set())
+        for obj in rows:
+            if "pk" in obj:
+                visibles.add(obj["pk"])
+
+def serialize_polymorphic_qs(qs, rel_dict=None, filtered_fields=None, memo=None):
     objs = list()
     pks = qs.values("pk")
 
     for field in qs.model._subclasses_fields:
-        objs += serialize_qs(field.model.objects.filter(pk__in=pks), rel_dict, filtered_fields)
+        objs += serialize_qs(field.model.objects.filter(pk__in=pks), rel_dict, filtered_fields, memo)
 
     return objs
 
-def serialize_qs(qs, rel_dict = None, filtered_fields = None):
+def collect_relateds(model, obj, rel_dict, filtered_fields):
+    for field in model._relateds_fields:
+        field_name = field.name
+        if not field_name in filtered_fields:
+            continue
+
+        rel_model = field.related_model
+        if not rel_model in rel_dict:
+            rel_dict[rel_model] = set()
+        if field.many_to_many or getattr(field, "multiple", False):
+            pks = obj[field_name + "_pks"]
+        else:
+            pks = [obj[field_name]]
+        rel_dict[rel_model].update(pks)
+
+def get_m2m_strategy(model, field, m2m_count):
+    strategy = model.m2m_strategies.get(field.name, model.m2m_strategy)
+    if strategy == "auto":
+        strategy = "prefetch" if m2m_count >= M2M_PREFETCH_THRESHOLD else "aggregate"
+    return strategy
+
+def related_ordering(rel_model, path):
+    ordering = list()
+    for ordering_rule in rel_model._meta.ordering:
+        rel_name = path
+        if ordering_rule[0] == "-":
+            ordering_rule = ordering_rule[1:]
+            rel_name = "-" + path
+        ordering.append(f"{rel_name}__{ordering_rule}")
+    return ordering
+
+def m2m_pairs_qs(model, field, pks):
+    # (source pk, related pk) rows for one m2m or reverse foreign key, in the order ArrayAgg would use
+    rel_model = field.related_model
+
+    if not field.many_to_many: # Reverse foreign key
+        source = field.field.name
+        qs = rel_model._base_manager.filter(**{f"{source}__in": pks})
+        ordering = rel_model._meta.ordering or ["pk"] # ArrayAgg(distinct=True) returns sorted pks
+        return qs.order_by(*ordering).values_list(field.field.attname, "pk")
+
+    if isinstance(field, ManyToManyField):
+        through = field.remote_field.through
+        source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+    else: # Reverse many to many
+        through = field.through
+        source, target = field.field.m2m_reverse_field_name(), field.field.m2m_field_name()
+
+    if field.name in model._through_ordering:
+        ordering = through._meta.ordering
+    elif rel_model._meta.ordering:
+        ordering = related_ordering(rel_model, target)
+    else:
+        ordering = [target] # ArrayAgg(distinct=True) returns sorted pks
+
+    qs = through._base_manager.filter(**{f"{source}__in": pks})
+    return qs.order_by(*ordering).values_list(source, target)
+
+def prefetch_m2m_pks(model, vals, m2m_fields):
+    # One query per field against the through table instead of a JOIN + GROUP BY on the main query
+    pks = [obj["pk"] for obj in vals]
+    if not pks:
+        return
+
+    for field in m2m_fields:
+        related_pks = {pk: dict() for pk in pks}
+        for source_pk, related_pk in m2m_pairs_qs(model, field, pks):
+            related_pks[source_pk][related_pk] = None # dict keeps the order and makes PKs unique
+
+        f_name = f"{field.name}_pks"
+        for obj in vals:
+            obj[f_name] = list(related_pks[obj["pk"]])
+
+def serialize_qs(qs, rel_dict = None, filtered_fields = None, memo = None):
     if qs._iterable_class is ValuesIterable:
         return list(qs)
 
     model = qs.model
 
     if model._subclasses_fields:  # Serialize each type of subclasses independently
-        return serialize_polymorphic_qs(qs, rel_dict, filtered_fields)
+        return serialize_polymorphic_qs(qs, rel_dict, filtered_fields, memo)
+
+    requested_fields = filtered_fields
 
     model_name = str(model._meta)
-    annotations = model.api_annotations.copy()
 
     if not filtered_fields:
         filtered_fields = model._all_fields
+        annotations = model.api_annotations.copy()
+    else: # Unrequested aggregations are not computed at all
+        annotations = {name: annotation for name, annotation in model.api_annotations.items() if name in filtered_fields}
+    filtered_fields = set(filtered_fields)
 
-    fields = model._direct_fields & set(filtered_fields)
+    fields = model._direct_fields & filtered_fields
 
     # Fetch all pks for m2m
+    m2m_fields = [field for field in model._m2m_fields if field.name in filtered_fields]
+    prefetched_fields = [field for field in m2m_fields if get_m2m_strategy(model, field, len(m2m_fields)) == "prefetch"]
+    aggregated_fields = list()
     pythonic_distinct_fields = list()
-    for field in model._m2m_fields:
-        field_name = field.name
-        if not field_name in filtered_fields:
+    for field in m2m_fields:
+        if field in prefetched_fields:
             continue
 
+        field_name = field.name
         filter_args = dict()
         filter_args[field_name] = None
         rel_model = field.related_model
 
         f_name = f"{field_name}_pks"
+        aggregated_fields.append(f_name)
         if field_name in model._through_ordering:
             ordering = model._through_ordering[field_name]
         elif rel_model._meta.ordering:
-            ordering = list()
-            for ordering_rule in rel_model._meta.ordering:
-                rel_name = field_name
-                if ordering_rule[0] == "-":
-                    ordering_rule = ordering_rule[1:]
-                    rel_name = "-" + field_name
-                ordering.append(f"{rel_name}__{ordering_rule}")
+            ordering = related_ordering(rel_model, field_name)
         else:
             ordering = list()
 
@@ -60,12 +171,18 @@ def serialize_qs(qs, rel_dict = None, filtered_fields = None):
             pythonic_distinct_fields.append(f_name) # Cannot do distinct=True + ordering with ArrayAgg, distinct is made below in Python
         else:
             annotations[f_name] = ArrayAgg(field_name, filter=~Q(**filter_args), distinct=True)
+
+    if prefetched_fields:
+        fields.add("pk") # Needed to stitch the prefetched pks
+
+    # Rows carrying the caller's own annotations differ from the model's rows, they cannot be shared
+    memoizable = memo is not None and not set(qs.query.annotations) - set(annotations)
     try:
         qs = qs.annotate(**annotations)
     except NotSupportedError:
         # Sometimes annotate is not supported on specific QS ( .difference for example)
         # Making a new request to get a clean QS is still faster
-        return serialize_qs(model.objects.filter(pk__in=qs.values("pk")), rel_dict, filtered_fields)
+        return serialize_qs(model.objects.filter(pk__in=qs.values("pk")), rel_dict, requested_fields, memo)
 
     fields.update(qs.query.annotations.keys())
 
@@ -75,9 +192,20 @@ def serialize_qs(qs, rel_dict = None, filtered_fields = None):
 
     vals = list(qs.values(*fields))
 
+    if prefetched_fields:
+        prefetch_m2m_pks(model, vals, prefetched_fields)
+
+        if not "pk" in filtered_fields:
+            for obj in vals:
+                del obj["pk"]
+
     for obj in vals:
         obj["_model_name"] = model_name
 
+        for field_name in aggregated_fields:
+            if obj[field_name] is None: # ArrayAgg returns None instead of an empty list since Django 5.0
+                obj[field_name] = list()
+
         for field_name in pythonic_distinct_fields:
             obj[field_name] = list(OrderedDict.fromkeys(obj[field_name])) # Make PKs unique
 
@@ -92,22 +220,11 @@ def serialize_qs(qs, rel_dict = None, filtered_fields = None):
 
             obj[field_name] = serialize(obj[field_name])
 
-        if type(rel_dict) is not dict:
-            continue
-
-        for field in model._relateds_fields:
-            field_name = field.name
-            if not field_name in filtered_fields:
-                continue
+        if type(rel_dict) is dict:
+            collect_relateds(model, obj, rel_dict, filtered_fields)
 
-            rel_model = field.related_model
-            if not rel_model in rel_dict:
-                rel_dict[rel_model] = set()
-            if field.many_to_many or getattr(field, "multiple", False):
-                pks = obj[field_name + "_pks"]
-            else:
-                pks = [obj[field_name]]
-            rel_dict[rel_model] = rel_dict[rel_model].union(set(pks))
+    if memoizable:
+        memo.add(model, vals, requested_fields)
 
     return vals
 
@@ -121,41 +238,153 @@ def sanitize_qs(qs, user=None):
 
     return qs
 
-def serialize(obj, user=None, relateds_dict=None, qs_fields_filter=[], sanitize=True):
-    if type(obj) in (int, float, str, None, bool):
-        return obj
+class SerializationContext():
+    def __init__(self, user=None, relateds_dict=None, qs_fields_filter=[], sanitize=True, memo=None):
+        self.user = user
+        self.relateds_dict = relateds_dict
+        self.qs_fields_filter = qs_fields_filter
+        self.sanitize = sanitize
+        self.memo = memo
+
+def serialize_instance(obj, context):
+    model = obj._meta.model
+    memo = context.memo
+    needs_sanitize = bool(context.sanitize and context.user) and not (memo is not None and memo.is_visible(model, obj.pk))
+
+    if memo is not None and not needs_sanitize:
+        inst = memo.get(model, obj.pk, context.qs_fields_filter)
+        if inst is not None:
+            if type(context.relateds_dict) is dict:
+                collect_relateds(model, inst, context.relateds_dict, context.qs_fields_filter or model._all_fields)
+            return inst
+
+    qs = model.objects.filter(pk=obj.pk)
+    if needs_sanitize:
+        qs = sanitize_qs(qs, context.user)
+    try:
+        inst = serialize_qs(qs, context.relateds_dict, context.qs_fields_filter, memo)[0]
+    except IndexError:
+        inst = None
+        # raise ApiException(f"This {model.__name__} does not exists.", 404)
+
+    if needs_sanitize and inst is not None and memo is not None:
+        memo.add_visibles(model, [inst])
+    return inst
+
+def serialize_queryset(obj, context):
+    if context.sanitize:
+        obj = sanitize_qs(obj, context.user)
+    vals = serialize_qs(obj, context.relateds_dict, context.qs_fields_filter, context.memo)
+
+    if context.sanitize and context.user and context.memo is not None:
+        context.memo.add_visibles(obj.model, vals)
+    return vals
 
-    if isinstance(obj, BaseModel):
-        model = obj._meta.model
-        qs = model.objects.filter(pk=obj.pk)
-        if sanitize:
-            qs = sanitize_qs(qs, user)
-        try:
-            inst = serialize_qs(qs, relateds_dict, qs_fields_filter)[0]
-        except IndexError:
-            inst = None
-            # raise ApiException(f"This {model.__name__} does not exists.", 404)
-        return inst
-    if type(obj) is memoryview:
-        return base64.encodebytes(obj).decode("utf-8")
+# type -> func(obj, context), resolved through the type's MRO
+SERIALIZERS = {
+    BaseModel: serialize_instance,
+    QuerySet: serialize_queryset,
+    memoryview: lambda obj, context: base64.encodebytes(obj).decode("utf-8"),
+    Decimal: lambda obj, context: str(obj),
+    set: lambda obj, context: list(obj),
+    frozenset: lambda obj, context: list(obj),
+}
+
+def register_serializer(klass, func):
+    SERIALIZERS[klass] = func
+
+def get_serializer(obj):
+    for klass in type(obj).__mro__:
+        if klass in SERIALIZERS:
+            return SERIALIZERS[klass]
+    return None
+
+def dumps(obj, context, option=orjson.OPT_NON_STR_KEYS):
+    # orjson walks the structure itself and only calls back for the types it does not know
+    def default(obj):
+        func = get_serializer(obj)
+        if func is None:
+            raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+        return func(obj, context)
+
+    return orjson.dumps(obj, default=default, option=option)
+
+def serialize(obj, user=None, relateds_dict=None, qs_fields_filter=[], sanitize=True, memo=None):
+    return serialize_with_context(obj, SerializationContext(user, relateds_dict, qs_fields_filter, sanitize, memo))
+
+def serialize_with_context(obj, context):
+    if obj is None or type(obj) in (int, float, str, bool):
+        return obj
 
     if type(obj) is dict:
         for key, value in obj.items():
-            obj[key] = serialize(value, user, relateds_dict, qs_fields_filter, sanitize)
+            obj[key] = serialize_with_context(value, context)
         return obj
 
-    if type(obj) in (QuerySet):
-        if sanitize:
-            obj = sanitize_qs(obj, user)
-        return serialize_qs(obj, relateds_dict, qs_fields_filter)
-
     if type(obj) in (set, list, tuple):
-        return [serialize(el, user, relateds_dict, qs_fields_filter, sanitize) for el in obj]
+        return [serialize_with_context(el, context) for el in obj]
+
+    func = get_serializer(obj)
+    if func is None:
+        return obj
+
+    value = func(obj, context)
+    if func in (serialize_instance, serialize_queryset):
+        return value # Rows are already final
 
-    return obj
+    return serialize_with_context(value, context)
+
+def resolve_relateds_fields(relateds_fields):
+    # {"app.Model": [fields]} -> {Model: [fields]}, validated against exposed fields
+    resolved = dict()
+    if not relateds_fields:
+        return resolved
+
+    if type(relateds_fields) is not dict:
+        raise ApiException("relateds_fields must be a dict", 400)
+
+    for model_name, fields in relateds_fields.items():
+        try:
+            app, name = model_name.split(".")
+            model = apps.get_model(app_label=app, model_name=name)
+        except (ValueError, LookupError):
+            raise ApiException(f"Wrong model name in relateds_fields : {model_name}", 400)
+
+        if not issubclass(model, BaseModel):
+            raise ApiException(f"Wrong model name in relateds_fields : {model_name}", 400)
+
+        if type(fields) not in (list, tuple):
+            raise ApiException(f"relateds_fields for {model_name} must be a list", 400)
+
+        for field_name in fields:
+            if type(field_name) is not str or "__" in field_name or not (model.is_exposed(field_name) or field_name in model.api_annotations):
+                raise ApiException(f"Field {field_name} is not valid for {model.__name__}", 400)
+
+        resolved[model] = ["pk", *fields]
+
+    return resolved
+
+def serialize_relateds(rel_dict, relateds_fields=None, memo=None):
+    if relateds_fields is None:
+        relateds_fields = dict()
 
-def serialize_relateds(rel_dict):
     items = list()
     for model, pks in rel_dict.items():
-        items += serialize_qs(model.objects.filter(pk__in=pks))
+        fields = relateds_fields.get(model)
+
+        if memo is not None:
+            # Rows already serialized in the response are referenced instead of fetched again
+            missing_pks = list()
+            for pk in pks:
+                inst = memo.get(model, pk, fields)
+                if inst is None:
+                    missing_pks.append(pk)
+                else:
+                    items.append(inst)
+            pks = missing_pks
+
+            if not pks:
+                continue
+
+        items += serialize_qs(model.objects.filter(pk__in=pks), None, fields, memo)
     return items
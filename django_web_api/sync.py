@@ -0,0 +1,119 @@
+from collections import defaultdict
+from django.db.models import ManyToManyField
+from django.utils import timezone
+from .basemodel import BaseModel
+from .models import deferred_tombstones
+
+# Exposed reverse foreign keys and m2m are part of a synced row (the "<field>_pks" lists), so changing them
+# has to bump the row's updated_at or the sync action never sends the new lists.
+# QuerySet.update() and bulk_update() send no signals, callers moving children that way touch the parents themselves.
+
+def is_synced(model, field_name):
+    return issubclass(model, BaseModel) and model.track_deletions and field_name in model.exposed_fields
+
+def touch(model, pks, using=None):
+    pks = set(pk for pk in pks if pk is not None)
+    if pks:
+        model._base_manager.using(using).filter(pk__in=pks).update(updated_at=timezone.now())
+
+def touch_all(parents, using=None):
+    for parent, pks in parents.items():
+        touch(parent, pks, using)
+
+def synced_parent_fks(model):
+    # Foreign keys of model whose reverse accessor is exposed on a synced parent
+    return [
+        field for field in model._meta.concrete_fields
+        if field.many_to_one and is_synced(field.related_model, field.remote_field.name)
+    ]
+
+def synced_m2m(model):
+    # (through, source, target, parent) for each m2m of model exposed on a synced model at the other end
+    relations = list()
+    for field in model._meta.get_fields():
+        if not field.many_to_many:
+            continue
+
+        if isinstance(field, ManyToManyField):
+            through = field.remote_field.through
+            if is_synced(field.related_model, field.remote_field.name):
+                relations.append((through, field.m2m_field_name(), field.m2m_reverse_field_name(), field.related_model))
+        else: # Reverse many to many
+            through = field.through
+            if is_synced(field.related_model, field.field.name):
+                relations.append((through, field.field.m2m_reverse_field_name(), field.field.m2m_field_name(), field.related_model))
+    return relations
+
+def deleted_parents(model, instances, using=None):
+    # Has to run before the delete, the through rows are gone afterwards
+    parents = defaultdict(set)
+
+    for field in synced_parent_fks(model):
+        parents[field.related_model].update(getattr(instance, field.attname) for instance in instances)
+
+    pks = [instance.pk for instance in instances]
+    for through, source, target, parent in synced_m2m(model):
+        parents[parent].update(
+            through._base_manager.using(using).filter(**{f"{source}__in": pks}).values_list(target, flat=True)
+        )
+
+    return parents
+
+def remember_parents(sender, instance, raw=False, using=None, update_fields=None, **kwargs):
+    # The previous parents lose the child, they can only be read before the save
+    if raw or instance._state.adding:
+        return
+
+    attnames = [field.attname for field in synced_parent_fks(sender)]
+    if update_fields is not None:
+        attnames = [attname for attname in attnames if attname in update_fields]
+    if not attnames:
+        return
+
+    instance._api_previous_parents = sender._base_manager.using(using).filter(pk=instance.pk).values(*attnames).first() or dict()
+
+def touch_parents(sender, instance, created=False, raw=False, using=None, **kwargs):
+    previous = instance.__dict__.pop("_api_previous_parents", dict())
+    if raw:
+        return
+
+    for field in synced_parent_fks(sender):
+        current = getattr(instance, field.attname)
+        if created:
+            touch(field.related_model, [current], using)
+        elif field.attname in previous and previous[field.attname] != current:
+            touch(field.related_model, [previous[field.attname], current], using)
+
+def touch_deleted_parents(sender, instance, using=None, **kwargs):
+    if deferred_tombstones.get():
+        return # The delete engine touches them in bulk
+
+    touch_all(deleted_parents(sender, [instance], using), using)
+
+def touch_m2m_parents(sender, instance, action, reverse, model, pk_set, using=None, **kwargs):
+    instance_model = type(instance)
+    field = next(field for field in (model if reverse else instance_model)._meta.many_to_many if field.remote_field.through is sender)
+
+    if reverse:
+        source, target = field.m2m_reverse_field_name(), field.m2m_field_name()
+        instance_synced = is_synced(instance_model, field.remote_field.name)
+        other_synced = is_synced(model, field.name)
+    else:
+        source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+        instance_synced = is_synced(instance_model, field.name)
+        other_synced = is_synced(model, field.remote_field.name)
+
+    if action == "pre_clear" and other_synced:
+        # clear() sends no pks, they are read before the through rows go away
+        instance._api_cleared_pks = list(sender._base_manager.using(using).filter(**{source: instance.pk}).values_list(target, flat=True))
+
+    if not action in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if action == "post_clear":
+        pk_set = instance.__dict__.pop("_api_cleared_pks", list())
+
+    if instance_synced:
+        touch(instance_model, [instance.pk], using)
+    if other_synced:
+        touch(model, pk_set, using)
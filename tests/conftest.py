@@ -0,0 +1,21 @@
+import os
+import sys
+
+import django
+import pytest
+
+# testapp has to be a top-level package: handlers are resolved as "<app>.handlers.<name>"
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "testapp.settings")
+django.setup()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def django_test_databases():
+    from django.test.utils import setup_test_environment, teardown_test_environment, setup_databases, teardown_databases
+
+    setup_test_environment()
+    config = setup_databases(verbosity=0, interactive=False)
+    yield
+    teardown_databases(config, verbosity=0)
+    teardown_test_environment()
@@ -0,0 +1,72 @@
+from unittest import mock
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django_web_api.deletion import delete_queryset
+from django_web_api.exceptions import ApiException
+from testapp.models import Author, Book, Log, Tag
+from .utils import create_user, crud_handler
+
+
+class DeletionTest(TestCase):
+    def setUp(self):
+        self.handler = crud_handler(create_user())
+        tags = [Tag.objects.create(name=name) for name in "abc"]
+
+        for index in range(3):
+            author = Author.objects.create(name=str(index))
+            for title in ("x", "y"):
+                Book.objects.create(title=title, author=author).tags.set(tags)
+
+    def test_dry_run_counts_cascades(self):
+        resp = self.handler.delete(Author, [], dry_run=True)
+
+        self.assertEqual(resp["deleteds"], {"testapp.Author": 3, "testapp.Book": 6, "testapp.Book_tags": 18})
+        self.assertEqual(resp["length"], 27)
+        self.assertTrue(resp["dry_run"])
+        self.assertEqual(Author.objects.count(), 3)
+        self.assertEqual(Book.objects.count(), 6)
+
+    def test_dry_run_matches_delete(self):
+        dry_run = delete_queryset(Author.objects.all(), dry_run=True, chunk_size=2)
+        deleted = delete_queryset(Author.objects.all(), chunk_size=2)
+
+        self.assertEqual(dry_run, deleted)
+        self.assertFalse(Book.objects.exists())
+
+    def test_fast_delete_is_a_single_statement(self):
+        Log.objects.bulk_create([Log(message=str(index)) for index in range(10)])
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.handler.delete(Log, [])
+
+        self.assertEqual(resp["deleteds"], {"testapp.Log": 10})
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0]["sql"].startswith("DELETE"))
+
+    def test_chunked_delete(self):
+        resp = self.handler.delete(Author, [], mode="chunked")
+
+        self.assertEqual(resp["deleteds"], {"testapp.Author": 3, "testapp.Book": 6, "testapp.Book_tags": 18})
+        self.assertFalse(Author.objects.exists())
+        self.assertEqual(Tag.objects.count(), 3)
+
+    def test_sliced_delete(self):
+        resp = self.handler.delete(Tag, [], limit=1, start=1)
+
+        self.assertEqual(resp["deleteds"], {"testapp.Tag": 1, "testapp.Book_tags": 6})
+        self.assertEqual(list(Tag.objects.values_list("name", flat=True)), ["a", "c"])
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ApiException) as cm:
+            self.handler.delete(Author, [], mode="fast")
+        self.assertEqual(cm.exception.status, 400)
+
+    def test_chunked_delete_is_not_atomic(self):
+        self.assertFalse(self.handler.is_atomic({"action": "delete", "model": "testapp.Author", "data": {"mode": "chunked"}}))
+        self.assertTrue(self.handler.is_atomic({"action": "delete", "model": "testapp.Author", "data": {}}))
+        self.assertTrue(self.handler.is_atomic({"action": "delete", "model": "testapp.Unknown", "data": {"mode": "chunked"}}))
+
+    def test_custom_delete_stays_atomic(self):
+        with mock.patch.object(Author, "_crud__delete", lambda request, **data: [], create=True):
+            self.assertTrue(self.handler.is_atomic({"action": "delete", "model": "testapp.Author", "data": {"mode": "chunked"}}))
@@ -0,0 +1,118 @@
+from datetime import timedelta
+from unittest import mock
+from django.test import TransactionTestCase
+from django.utils import timezone
+from django_web_api.handler import handle_request
+from django_web_api.jobs import run_pending_jobs
+from django_web_api.models import Job
+from testapp.models import Note
+from .utils import call, create_user, make_request
+import orjson
+import zlib
+
+PERMISSIONS = ["handler:testapp__report"]
+
+
+class JobTest(TransactionTestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.note = Note.objects.create(text="hi", owner=self.user)
+        self.note_pk = str(self.note.pk)
+
+    def submit(self, **args):
+        body = orjson.dumps({"handler": "testapp.report", "args": {"note": self.note_pk, **args}})
+        request = make_request(self.user, PERMISSIONS, body)
+        request.META["HTTP_COOKIE"] = "sessionid=secret"
+        request.META["HTTP_AUTHORIZATION"] = "Bearer secret"
+        return handle_request(request)
+
+    def job_call(self, handler, job_id, user=None):
+        return call(user or self.user, f"django_web_api.{handler}", {"job": str(job_id)})
+
+    def test_lifecycle(self):
+        resp = self.submit(repeat=2)
+        self.assertEqual(resp.status_code, 200)
+        ack = orjson.loads(resp.content)
+        self.assertEqual(set(ack), {"job", "status", "generated_on"})
+
+        status = orjson.loads(self.job_call("job_status", ack["job"]).content)
+        self.assertEqual(status["job"]["status"], Job.PENDING)
+        self.assertEqual(self.job_call("job_result", ack["job"]).status_code, 409)
+
+        self.assertEqual(run_pending_jobs(), 1)
+
+        status = orjson.loads(self.job_call("job_status", ack["job"]).content)
+        self.assertEqual(status["job"]["status"], Job.DONE)
+
+        resp = self.job_call("job_result", ack["job"])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Encoding"], "deflate")
+        result = orjson.loads(zlib.decompress(resp.content))
+        self.assertEqual(result["text"], "hihi")
+        self.assertEqual(result["user"], "bob")
+        self.assertEqual(result["permissions"], PERMISSIONS)
+        self.assertEqual(result["relateds"], [])
+        self.assertEqual((result["agent"], result["query"], result["cookie"]), (None, None, None)) # Not kept from the request
+
+    def test_payload_keeps_no_headers(self):
+        job_id = orjson.loads(self.submit().content)["job"]
+        payload = bytes(Job.objects.get(pk=job_id).payload)
+
+        self.assertNotIn(b"secret", payload)
+        self.assertEqual(orjson.loads(payload), {
+            "args": {"note": self.note_pk},
+            "session": {"permissions": PERMISSIONS},
+        })
+
+    def test_arguments_are_checked_upfront(self):
+        self.note.delete()
+        resp = self.submit()
+
+        self.assertEqual(resp.status_code, 404)
+        self.assertFalse(Job.objects.exists())
+
+    def test_failing_job(self):
+        job_id = orjson.loads(self.submit().content)["job"]
+        self.note.delete()
+        run_pending_jobs()
+
+        job = Job.objects.get(pk=job_id)
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(self.job_call("job_result", job_id).status_code, 404)
+
+    def test_jobs_are_private(self):
+        job_id = orjson.loads(self.submit().content)["job"]
+        other = create_user("alice")
+
+        self.assertEqual(self.job_call("job_status", job_id, other).status_code, 404)
+        self.assertEqual(self.job_call("job_result", job_id, other).status_code, 404)
+
+    def test_stale_jobs_fail_and_get_purged(self):
+        job_id = orjson.loads(self.submit().content)["job"]
+        long_ago = timezone.now() - timedelta(days=2)
+        Job.objects.filter(pk=job_id).update(status=Job.RUNNING, started_at=long_ago)
+
+        status = orjson.loads(self.job_call("job_status", job_id).content)
+        self.assertEqual(status["job"]["status"], Job.FAILED)
+        self.assertEqual(self.job_call("job_result", job_id).status_code, 504)
+
+        # A late worker does not overwrite the timeout
+        job = Job.objects.get(pk=job_id)
+        job.status = Job.RUNNING
+        job.finish(b"{}", 200)
+        self.assertEqual(Job.objects.get(pk=job_id).status, Job.FAILED)
+
+        Job.objects.filter(pk=job_id).update(created_at=long_ago)
+        self.assertEqual(Job.purge(), 1)
+
+    def test_lost_pending_jobs_fail(self):
+        job_id = orjson.loads(self.submit().content)["job"]
+        Job.objects.filter(pk=job_id).update(created_at=timezone.now() - timedelta(days=2))
+
+        # Still queued in the database, run_api_jobs will pick it
+        self.assertEqual(self.job_call("job_result", job_id).status_code, 409)
+        self.assertEqual(Job.fail_stale(), 0)
+
+        with mock.patch("django_web_api.jobs.BACKGROUND_EXECUTOR", "django_web_api.jobs.ThreadExecutor"):
+            self.assertEqual(self.job_call("job_result", job_id).status_code, 504)
+            self.assertEqual(Job.purge(), 1)
@@ -0,0 +1,97 @@
+from unittest import mock, skipUnless
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django_web_api.serializers import serialize
+from testapp.models import Author, Book, Tag
+
+
+class M2MStrategyTest(TestCase):
+    def setUp(self):
+        tags = [Tag.objects.create(name=name) for name in "cab"]
+        ursula = Author.objects.create(name="Ursula")
+        Author.objects.create(name="Nobody")
+
+        first = Book.objects.create(title="1", author=ursula)
+        first.tags.set(tags)
+        second = Book.objects.create(title="2", author=ursula)
+        second.tags.set(tags[:1])
+        Book.objects.create(title="3", author=ursula)
+
+    def serialize_all(self):
+        return {
+            model.__name__: sorted(serialize(model.objects.all()), key=lambda row: str(row["pk"]))
+            for model in (Book, Author, Tag)
+        }
+
+    def with_strategy(self, strategy):
+        patches = [mock.patch.object(model, "m2m_strategy", strategy) for model in (Book, Author, Tag)]
+        for patch in patches:
+            patch.start()
+        self.addCleanup(lambda: [patch.stop() for patch in patches])
+
+    def test_prefetch_stitching(self):
+        data = self.serialize_all()
+        tag_names = {tag.pk: tag.name for tag in Tag.objects.all()}
+        books = {row["title"]: row for row in data["Book"]}
+
+        self.assertEqual([tag_names[pk] for pk in books["1"]["tags_pks"]], ["a", "b", "c"]) # Tag ordering
+        self.assertEqual([tag_names[pk] for pk in books["2"]["tags_pks"]], ["c"])
+        self.assertEqual(books["3"]["tags_pks"], [])
+        self.assertEqual(
+            {row["name"]: len(row["books_pks"]) for row in data["Author"]},
+            {"Ursula": 3, "Nobody": 0},
+        )
+        self.assertEqual(
+            {row["name"]: len(row["books_pks"]) for row in data["Tag"]},
+            {"a": 1, "b": 1, "c": 2},
+        )
+
+    def test_prefetch_keeps_pk_out_of_filtered_rows(self):
+        rows = serialize(Book.objects.all(), None, None, ["title", "tags"])
+        self.assertEqual(set(rows[0]), {"title", "tags_pks", "_model_name"})
+
+    def test_auto_strategy(self):
+        self.with_strategy("auto")
+
+        with CaptureQueriesContext(connection) as queries:
+            serialize(Book.objects.all(), None, None, ["title"])
+        self.assertEqual(len(queries), 1)
+
+        with mock.patch("django_web_api.serializers.M2M_PREFETCH_THRESHOLD", 1), CaptureQueriesContext(connection) as queries:
+            serialize(Book.objects.all(), None, None, ["title", "tags"])
+        self.assertEqual(len(queries), 2)
+
+    def test_invalid_strategies(self):
+        for attribute, value in (
+            ("m2m_strategy", "bogus"),
+            ("m2m_strategies", {"tags": "bogus"}),
+            ("m2m_strategies", {"tagz": "prefetch"}),
+            ("m2m_strategies", {"title": "prefetch"}),
+        ):
+            with self.subTest(**{attribute: value}), mock.patch.object(Book, attribute, value):
+                with self.assertRaises(Exception):
+                    Book._compute_fields()
+        Book._compute_fields()
+
+    @skipUnless(connection.vendor == "postgresql", "ArrayAgg needs PostgreSQL")
+    def test_aggregate_and_prefetch_parity(self):
+        self.maxDiff = None
+        prefetched = self.serialize_all()
+        self.with_strategy("aggregate")
+        aggregated = self.serialize_all()
+
+        self.assertEqual(prefetched, aggregated)
+
+    @skipUnless(connection.vendor == "postgresql", "ArrayAgg needs PostgreSQL")
+    def test_per_field_strategy(self):
+        self.with_strategy("aggregate")
+        prefetched = mock.patch.object(Book, "m2m_strategies", {"tags": "prefetch"})
+        prefetched.start()
+        self.addCleanup(prefetched.stop)
+
+        with CaptureQueriesContext(connection) as queries:
+            rows = serialize(Book.objects.filter(title="1"), None, None, ["title", "tags"])
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn("ARRAY_AGG", queries[0]["sql"].upper())
+        self.assertEqual(len(rows[0]["tags_pks"]), 3)
@@ -0,0 +1,70 @@
+from django.db import connection
+from django.db.models import CharField, Value
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django_web_api.serializers import SerializationMemo, serialize, serialize_relateds
+from testapp.models import Note
+from .utils import create_user
+
+
+class SerializationMemoTest(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        other = create_user("alice")
+        self.mine = [Note.objects.create(text=str(index), owner=self.user) for index in range(2)]
+        self.theirs = Note.objects.create(text="theirs", owner=other)
+
+    def serialize(self, memo):
+        notes = [*self.mine, self.theirs]
+        with CaptureQueriesContext(connection) as queries:
+            data = serialize({
+                "qs": Note.objects.all(),
+                "list": notes,
+                "nested": {"note": self.mine[0]},
+            }, self.user, None, [], True, memo)
+            relateds = serialize_relateds({Note: {note.pk for note in notes}}, None, memo)
+        return data, relateds, len(queries)
+
+    def test_same_output_with_fewer_queries(self):
+        without_memo = self.serialize(None)
+        with_memo = self.serialize(SerializationMemo())
+
+        self.assertEqual(with_memo[0], without_memo[0])
+        self.assertEqual(
+            sorted(row["text"] for row in with_memo[1]),
+            sorted(row["text"] for row in without_memo[1]),
+        )
+        self.assertEqual(without_memo[2], 6)
+        # Sanitized queryset, the invisible note looked up again, then only that one for relateds
+        self.assertEqual(with_memo[2], 3)
+
+    def test_sanitized_rows_do_not_leak(self):
+        data, _, _ = self.serialize(SerializationMemo())
+
+        self.assertEqual([row["text"] for row in data["qs"]], ["0", "1"])
+        self.assertIsNone(data["list"][2])
+
+    def test_unsanitized_rows_are_not_reused_for_sanitized_lookups(self):
+        memo = SerializationMemo()
+        unsanitized = serialize(self.theirs, self.user, None, [], False, memo)
+        sanitized = serialize(self.theirs, self.user, None, [], True, memo)
+
+        self.assertEqual(unsanitized["text"], "theirs")
+        self.assertIsNone(sanitized)
+
+    def test_fields_are_part_of_the_key(self):
+        memo = SerializationMemo()
+        full = serialize(self.mine[0], self.user, None, [], True, memo)
+        partial = serialize(self.mine[0], self.user, None, ["pk", "text"], True, memo)
+
+        self.assertIn("created_at", full)
+        self.assertEqual(set(partial), {"pk", "text", "_model_name"})
+
+    def test_annotated_rows_are_not_shared(self):
+        qs = Note.objects.annotate(secret=Value("hidden", output_field=CharField()))
+        with_memo = serialize({"qs": qs, "one": self.mine[0]}, self.user, None, [], True, SerializationMemo())
+        without_memo = serialize({"qs": qs, "one": self.mine[0]}, self.user, None, [], True, None)
+
+        self.assertEqual(with_memo, without_memo)
+        self.assertIn("secret", with_memo["qs"][0])
+        self.assertNotIn("secret", with_memo["one"])
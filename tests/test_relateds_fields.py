@@ -0,0 +1,62 @@
+from unittest import mock
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django_web_api.exceptions import ApiException
+from testapp.models import Author, Book, Tag
+from .utils import create_user, crud_handler
+
+
+class RelatedsFieldsTest(TestCase):
+    def setUp(self):
+        self.handler = crud_handler(create_user())
+        author = Author.objects.create(name="Ursula")
+        book = Book.objects.create(title="Earthsea", author=author)
+        book.tags.set([Tag.objects.create(name="fantasy")])
+
+    def relateds_by_model(self, resp):
+        return {row["_model_name"]: row for row in resp["relateds"]}
+
+    def test_relateds_restricted_to_requested_fields(self):
+        resp = self.handler.filter(Book, [], relateds=True, relateds_fields={"testapp.Author": ["name"]})
+        relateds = self.relateds_by_model(resp)
+
+        self.assertEqual(set(relateds["testapp.author"]), {"pk", "name", "_model_name"})
+        self.assertIn("books_pks", relateds["testapp.tag"])
+
+    def test_unrequested_annotations_are_not_computed(self):
+        with mock.patch.object(Author, "api_annotations", {"book_count": Count("books")}):
+            with CaptureQueriesContext(connection) as queries:
+                resp = self.handler.filter(Book, [], relateds=True, relateds_fields={"testapp.Author": ["name"]})
+            author_queries = [query["sql"] for query in queries if 'FROM "testapp_author"' in query["sql"]]
+
+            self.assertEqual(set(self.relateds_by_model(resp)["testapp.author"]), {"pk", "name", "_model_name"})
+            self.assertEqual(len(author_queries), 1)
+            self.assertNotIn("GROUP BY", author_queries[0])
+
+            resp = self.handler.filter(Book, [], relateds=True, relateds_fields={"testapp.Author": ["name", "book_count"]})
+            self.assertEqual(self.relateds_by_model(resp)["testapp.author"]["book_count"], 1)
+
+            resp = self.handler.filter(Book, [], relateds=True)
+            self.assertEqual(self.relateds_by_model(resp)["testapp.author"]["book_count"], 1)
+
+    def test_relateds_without_fields_are_complete(self):
+        resp = self.handler.filter(Book, [], relateds=True)
+        relateds = self.relateds_by_model(resp)
+
+        self.assertIn("books_pks", relateds["testapp.author"])
+        self.assertIn("created_at", relateds["testapp.author"])
+
+    def test_invalid_relateds_fields(self):
+        for relateds_fields in (
+            {"testapp.Author": ["unknown"]},
+            {"testapp.Author": ["books__title"]},
+            {"testapp.Author": "name"},
+            {"testapp.Unknown": ["name"]},
+            {"auth.User": ["username"]},
+            ["testapp.Author"],
+        ):
+            with self.subTest(relateds_fields=relateds_fields), self.assertRaises(ApiException) as cm:
+                self.handler.filter(Book, [], relateds=True, relateds_fields=relateds_fields)
+            self.assertEqual(cm.exception.status, 400)
@@ -0,0 +1,79 @@
+from decimal import Decimal
+from unittest import mock
+from django.test import TestCase
+from django_web_api import serializers
+from django_web_api.handler import format_handler_response
+from django_web_api.serializers import register_serializer, serialize
+from testapp.handlers.mixed import Point
+from testapp.models import Author, Book
+from .utils import call, create_user
+import orjson
+
+
+class OrjsonSerializationTest(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.author = Author.objects.create(name="Ursula")
+        self.book = Book.objects.create(title="Earthsea", price=Decimal("9.99"), author=self.author)
+
+        serializers_backup = serializers.SERIALIZERS.copy()
+        self.addCleanup(lambda: setattr(serializers, "SERIALIZERS", serializers_backup))
+
+    def call_mixed(self):
+        return call(self.user, "testapp.mixed", permissions=["handler:testapp__mixed"])
+
+    def test_unknown_type_fails(self):
+        resp = self.call_mixed()
+        self.assertEqual(resp.status_code, 500)
+
+    def test_handler_response(self):
+        register_serializer(Point, lambda obj, context: {"x": obj.x, "y": obj.y, "book": self.book})
+        resp = self.call_mixed()
+        self.assertEqual(resp.status_code, 200)
+        data = orjson.loads(resp.content)
+
+        self.assertEqual(data["decimal"], "1.10")
+        self.assertEqual(data["set"], [1])
+        self.assertEqual(data["book"]["title"], "Earthsea")
+        self.assertEqual(data["book"]["price"], "9.99")
+        self.assertEqual(data["nested"], [{"book": data["book"]}, [data["book"]]])
+        self.assertEqual(data["books"], [data["book"]])
+        self.assertEqual(data["point"], {"x": 1, "y": 2, "book": data["book"]})
+        self.assertEqual([row["_model_name"] for row in data["relateds"]], ["testapp.author"])
+
+    def test_handler_response_without_orjson_fragment(self):
+        register_serializer(Point, lambda obj, context: {"x": obj.x, "y": obj.y})
+        with mock.patch.dict(orjson.__dict__):
+            orjson.__dict__.pop("Fragment", None) # Added in orjson 3.9
+            resp = self.call_mixed()
+
+        self.assertEqual(resp.status_code, 200)
+        data = orjson.loads(resp.content)
+        self.assertEqual(data["point"], {"x": 1, "y": 2})
+        self.assertTrue(data["status"])
+        self.assertEqual([row["_model_name"] for row in data["relateds"]], ["testapp.author"])
+
+    def test_handler_keys_do_not_duplicate_response_keys(self):
+        handler = mock.Mock(prevent_serialization=False, relateds=False, user=None, sanitize=True, serialization_memo=None)
+
+        self.assertEqual(orjson.loads(format_handler_response(handler, {"status": False}))["status"], True)
+        self.assertEqual(set(orjson.loads(format_handler_response(handler, {}))), {"status", "generated_on"})
+
+    def test_crud_response_uses_the_dispatch_table(self):
+        resp = call(
+            self.user,
+            "testapp.crud",
+            {"action": "filter", "model": "testapp.Book", "data": {"filters": []}},
+            permissions=["crud:testapp__Book__read"],
+        )
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(orjson.loads(resp.content)["data"][0]["price"], "9.99")
+
+    def test_registered_types_in_serialize(self):
+        register_serializer(Point, lambda obj, context: {"x": obj.x, "book": self.book})
+        data = serialize({"point": Point(3, 4), "set": {self.book}})
+
+        self.assertEqual(data["point"]["x"], 3)
+        self.assertEqual(data["point"]["book"]["title"], "Earthsea")
+        self.assertEqual(data["set"][0]["title"], "Earthsea")
@@ -0,0 +1,193 @@
+from unittest import mock
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django_web_api.deletion import delete_queryset
+from django_web_api.exceptions import ApiException
+from django_web_api.models import Tombstone
+from testapp.models import Author, Book, Note, Tag
+from .utils import create_user, crud_handler
+
+
+@mock.patch("django_web_api.crud.SYNC_OVERLAP", 0)
+class SyncTest(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.handler = crud_handler(self.user)
+        self.authors = [Author.objects.create(name=f"L{index}") for index in range(4)]
+
+    def sync(self, model=Author, filters=(), **kwargs):
+        return self.handler.sync(model, list(filters), **kwargs)
+
+    def names(self, resp):
+        return [row["name"] for row in resp["data"]]
+
+    def test_first_sync_returns_everything(self):
+        resp = self.sync()
+
+        self.assertTrue(resp["reset"])
+        self.assertEqual(self.names(resp), ["L0", "L1", "L2", "L3"])
+        self.assertEqual(resp["deleted"], [])
+
+    def test_changes_since_watermark(self):
+        first = self.sync()
+
+        for author in reversed(self.authors):
+            author.save()
+
+        resp = self.sync(since=first["watermark"].isoformat())
+
+        self.assertFalse(resp["reset"])
+        self.assertEqual(self.names(resp), ["L3", "L2", "L1", "L0"]) # Ordered by updated_at
+
+        empty = self.sync(since=resp["watermark"].isoformat())
+        self.assertEqual(empty["data"], [])
+        self.assertEqual(empty["deleted"], [])
+
+    def test_deleted_since_watermark(self):
+        first = self.sync()
+        deleted = [self.authors[0].pk, self.authors[3].pk]
+
+        self.authors[0].delete()
+        self.authors[3].delete()
+
+        resp = self.sync(since=first["watermark"].isoformat())
+        self.assertEqual(resp["deleted"], deleted)
+
+        self.assertEqual(self.sync(since=resp["watermark"].isoformat())["deleted"], [])
+
+    def test_polling_does_not_scan_the_table(self):
+        first = self.sync()
+        self.authors[0].save()
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.sync(since=first["watermark"].isoformat())
+
+        self.assertEqual(self.names(resp), ["L0"])
+        for query in queries: # Only bounded lookups, by watermark or by the changed pks
+            self.assertIn("WHERE", query["sql"])
+
+    def test_rows_leaving_the_filter_are_deleted(self):
+        filters = [{"field": "name", "operator": "in", "value": ["L0", "L1"]}]
+        first = self.sync(filters=filters)
+
+        self.authors[1].name = "renamed"
+        self.authors[1].save()
+
+        resp = self.sync(filters=filters, since=first["watermark"].isoformat())
+        self.assertEqual(resp["data"], [])
+        self.assertEqual(resp["deleted"], [self.authors[1].pk])
+
+    def test_sanitized_rows_only_leak_their_pk(self):
+        other = create_user("alice")
+        Note.objects.create(text="mine", owner=self.user)
+        theirs = Note.objects.create(text="theirs", owner=other)
+
+        first = self.sync(Note)
+        self.assertEqual([row["text"] for row in first["data"]], ["mine"])
+
+        theirs.text = "changed"
+        theirs.save()
+        resp = self.sync(Note, since=first["watermark"].isoformat())
+        self.assertEqual(resp["data"], [])
+        self.assertEqual(resp["deleted"], [theirs.pk]) # The client ignores pks it does not have
+
+    def test_invalid_watermark(self):
+        for since in ("garbage", "2020-13-45T00:00:00", 12):
+            with self.subTest(since=since), self.assertRaises(ApiException):
+                self.sync(since=since)
+
+    def test_untracked_model_cannot_sync(self):
+        with self.assertRaises(ApiException):
+            self.sync(Book)
+
+    def test_update_reparenting_bumps_updated_at(self):
+        book = Book.objects.create(title="moved", author=self.authors[0])
+        before = book.updated_at
+
+        self.handler.update(Author, {"uuid": str(self.authors[1].pk), "books": [str(book.pk)]})
+
+        book.refresh_from_db()
+        self.assertEqual(book.author, self.authors[1])
+        self.assertGreater(book.updated_at, before)
+
+
+class TombstoneTest(TestCase):
+    def test_orm_delete_records_tombstone(self):
+        author = Author.objects.create(name="a")
+        pk = author.pk
+        author.delete()
+
+        self.assertEqual(list(Tombstone.objects.values_list("object_pk", flat=True)), [str(pk)])
+
+    def test_delete_engine_records_tombstones_in_bulk(self):
+        authors = [Author.objects.create(name=str(index)) for index in range(5)]
+
+        with CaptureQueriesContext(connection) as queries:
+            delete_queryset(Author.objects.all(), chunk_size=1000)
+
+        inserts = [query for query in queries if query["sql"].startswith('INSERT INTO "django_web_api_tombstone"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            set(Tombstone.objects.values_list("object_pk", flat=True)),
+            {str(author.pk) for author in authors},
+        )
+
+
+@mock.patch("django_web_api.crud.SYNC_OVERLAP", 0)
+class SyncRelationsTest(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.handler = crud_handler(self.user)
+        self.ursula = Author.objects.create(name="Ursula")
+        self.frank = Author.objects.create(name="Frank")
+        self.tag = Tag.objects.create(name="fantasy")
+        self.book = Book.objects.create(title="Earthsea", author=self.ursula)
+
+    def changes(self, model, action):
+        watermark = self.handler.sync(model, [])["watermark"]
+        action()
+        resp = self.handler.sync(model, [], since=watermark.isoformat())
+        return {row["name"]: row["books_pks"] for row in resp["data"]}
+
+    def test_crud_create_touches_parent(self):
+        changes = self.changes(Author, lambda: self.handler.create(Book, {"title": "Dune", "author": str(self.frank.pk)}))
+        self.assertEqual(list(changes), ["Frank"])
+        self.assertEqual(len(changes["Frank"]), 1)
+
+    def test_moving_a_child_touches_both_parents(self):
+        def move():
+            self.book.author = self.frank
+            self.book.save()
+
+        self.assertEqual(self.changes(Author, move), {"Ursula": [], "Frank": [self.book.pk]})
+
+    def test_editing_a_child_does_not_touch_its_parent(self):
+        def rename():
+            self.book.title = "A Wizard of Earthsea"
+            self.book.save()
+
+        self.assertEqual(self.changes(Author, rename), {})
+
+    def test_deleting_a_child_touches_its_parent(self):
+        self.assertEqual(self.changes(Author, self.book.delete), {"Ursula": []})
+
+    def test_update_reparenting_touches_previous_parent(self):
+        def update():
+            self.handler.update(Author, {"uuid": str(self.frank.pk), "books": [str(self.book.pk)]})
+
+        self.assertEqual(self.changes(Author, update), {"Ursula": [], "Frank": [self.book.pk]})
+
+    def test_m2m_changes_touch_the_other_side(self):
+        self.assertEqual(self.changes(Tag, lambda: self.book.tags.set([self.tag])), {"fantasy": [self.book.pk]})
+        self.assertEqual(self.changes(Tag, self.book.tags.clear), {"fantasy": []})
+        self.assertEqual(self.changes(Tag, lambda: self.tag.books.add(self.book)), {"fantasy": [self.book.pk]})
+
+    def test_delete_engine_touches_parents_in_bulk(self):
+        self.book.tags.set([self.tag])
+        Book.objects.create(title="Dune", author=self.frank).tags.set([self.tag])
+
+        changes = self.changes(Author, lambda: delete_queryset(Book.objects.all(), mode="chunked"))
+        self.assertEqual(changes, {"Ursula": [], "Frank": []})
+
+        self.assertEqual(self.handler.sync(Tag, [])["data"][0]["books_pks"], [])
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class TestAppConfig(AppConfig):
+    name = "testapp"
+
+    def ready(self):
+        from .models import Tag, Author, Book, Note, Log
+
+        for model in (Tag, Author, Book, Note, Log):
+            model._compute_fields()
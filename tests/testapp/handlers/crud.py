@@ -0,0 +1 @@
+from django_web_api.crud import Handler
@@ -0,0 +1,24 @@
+from decimal import Decimal
+from django_web_api.basehandler import BaseHandler
+from testapp.models import Book
+
+
+class Point():
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class Handler(BaseHandler):
+    relateds = True
+
+    def execute(self):
+        book = Book.objects.get()
+        return {
+            "decimal": Decimal("1.10"),
+            "set": {1},
+            "book": book,
+            "nested": [{"book": book}, (book,)],
+            "books": Book.objects.all(),
+            "point": Point(1, 2),
+        }
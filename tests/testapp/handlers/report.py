@@ -0,0 +1,18 @@
+from django_web_api.basehandler import BaseHandler
+from testapp.models import Note
+
+
+class Handler(BaseHandler):
+    background = True
+    relateds = True
+    zlib_compress = True
+
+    def execute(self, note: Note, repeat=1):
+        return {
+            "text": note.text * repeat,
+            "user": self.user.username,
+            "permissions": self.request.session.get("permissions"),
+            "agent": self.request.META.get("HTTP_USER_AGENT"),
+            "query": self.request.GET.get("q"),
+            "cookie": self.request.COOKIES.get("sessionid"),
+        }
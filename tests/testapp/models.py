@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.db import models
+from django_web_api.basemodel import BaseModel
+
+
+class Tag(BaseModel):
+    name = models.CharField(max_length=50)
+
+    exposed_fields = ("name", "books")
+    track_deletions = True
+    m2m_strategy = "prefetch"
+
+    class Meta:
+        ordering = ("name",)
+
+
+class Author(BaseModel):
+    name = models.CharField(max_length=50)
+
+    exposed_fields = ("name", "books")
+    track_deletions = True
+    m2m_strategy = "prefetch"
+
+
+class Book(BaseModel):
+    title = models.CharField(max_length=50)
+    price = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name="books")
+    tags = models.ManyToManyField(Tag, related_name="books")
+
+    exposed_fields = ("title", "price", "author", "tags")
+    m2m_strategy = "prefetch"
+
+
+class Note(BaseModel):
+    text = models.CharField(max_length=50)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.CASCADE, related_name="+")
+
+    exposed_fields = ("text",)
+    track_deletions = True
+
+    @classmethod
+    def _api_sanitize(cls, qs, user):
+        return qs.filter(owner=user)
+
+
+class Log(BaseModel):
+    message = models.CharField(max_length=50)
+
+    exposed_fields = ("message",)
@@ -0,0 +1,37 @@
+import os
+
+SECRET_KEY = "django-web-api-tests"
+DEBUG = False
+USE_TZ = True
+CACHE_DEFAULT_TIMEOUT = 60
+
+INSTALLED_APPS = [
+    "django.contrib.auth",
+    "django.contrib.contenttypes",
+    "django.contrib.sessions",
+    "django_web_api",
+    "testapp",
+]
+
+# ArrayAgg needs PostgreSQL, tests depending on it are skipped on SQLite
+if os.environ.get("POSTGRES_HOST"):
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "HOST": os.environ["POSTGRES_HOST"],
+            "PORT": os.environ.get("POSTGRES_PORT", ""),
+            "NAME": os.environ.get("POSTGRES_DB", "django_web_api"),
+            "USER": os.environ.get("POSTGRES_USER", "postgres"),
+            "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": ":memory:",
+        }
+    }
+
+DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
+API_BACKGROUND_EXECUTOR = "django_web_api.jobs.DatabaseExecutor"
@@ -0,0 +1,27 @@
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import RequestFactory
+from django_web_api.crud import Handler
+from django_web_api.handler import handle_request
+import orjson
+
+
+def make_request(user, permissions=(), body=b""):
+    request = RequestFactory().post("/", data=body, content_type="application/json")
+    request.user = user
+    request.session = SessionStore()
+    request.session["permissions"] = list(permissions)
+    return request
+
+
+def call(user, handler, args=None, permissions=(), **extra):
+    body = orjson.dumps({"handler": handler, "args": args or dict(), **extra})
+    return handle_request(make_request(user, permissions, body))
+
+
+def crud_handler(user):
+    return Handler("django_web_api.crud", make_request(user))
+
+
+def create_user(username="bob"):
+    return User.objects.create(username=username)